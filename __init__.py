@@ -1,4 +1,4 @@
-from mqtt_client.config import ConfigurationManager
+from mqtt_client.config import ConfigurationManager, MqttEnv
 from mqtt_client.ssl_context import SSLContextFactory, HiveMQSSLContextFactory
 from mqtt_client.message_handler import Message, MessageHandler, DefaultMessageHandler
 from mqtt_client.connection_handler import ConnectionHandler, DefaultConnectionHandler
@@ -7,6 +7,7 @@ from database import PostgresMQTTClient
 
 __all__ = [
     'ConfigurationManager',
+    'MqttEnv',
     'SSLContextFactory',
     'HiveMQSSLContextFactory',
     'Message',
@@ -14,6 +15,6 @@ __all__ = [
     'DefaultMessageHandler',
     'ConnectionHandler',
     'DefaultConnectionHandler',
-    'MQTTClientWrapper'
+    'MQTTClientWrapper',
     'PostgresMQTTClient',
 ]
@@ -1,7 +1,13 @@
+import io
+import threading
+import weakref
+from contextlib import contextmanager
 import psycopg2
-from psycopg2.extras import RealDictCursor
-from typing import Dict, List, Optional, Union
-from datetime import datetime
+import psycopg2.extensions
+from psycopg2.extras import RealDictCursor, execute_values
+from psycopg2.pool import ThreadedConnectionPool
+from typing import Dict, List, Optional, Tuple, Union
+from datetime import datetime, timezone
 
 from dotenv import load_dotenv
 import os
@@ -29,11 +35,56 @@ def parse_db_url(url: str) -> Dict[str, str]:
     }
 
 
+_PREPARED_STATEMENTS = (
+    "PREPARE mqtt_insert (varchar, bytea, integer, boolean, varchar, float8) AS "
+    "INSERT INTO mqtt_messages (topic, payload, qos, retain, client_id, timestamp) "
+    "VALUES ($1, $2, $3, $4, $5, COALESCE(to_timestamp($6), CURRENT_TIMESTAMP)) "
+    "RETURNING id",
+    "PREPARE mqtt_read_by_id (integer) AS "
+    "SELECT * FROM mqtt_messages WHERE id = $1",
+    "PREPARE mqtt_read_by_topic (varchar, integer) AS "
+    "SELECT * FROM mqtt_messages WHERE topic = $1 ORDER BY timestamp DESC LIMIT $2",
+    "PREPARE mqtt_delete_by_id (integer) AS "
+    "DELETE FROM mqtt_messages WHERE id = $1",
+    "PREPARE mqtt_delete_by_topic (varchar) AS "
+    "DELETE FROM mqtt_messages WHERE topic = $1",
+)
+
+# Session setup sent as one multi-statement query: a single network round-trip.
+# force_custom_plan avoids generic plans that ignore the actual parameter values.
+# The timestamp column has no time zone, so every session stores UTC: to_timestamp()
+# and CURRENT_TIMESTAMP then agree with the UTC values copy_messages renders.
+_SESSION_SETUP = ";\n".join(
+    ("SET plan_cache_mode = 'force_custom_plan'", "SET TIME ZONE 'UTC'")
+    + _PREPARED_STATEMENTS)
+
+
+# Casts bytea columns to bytes instead of psycopg2's default memoryview
+_BYTEA_AS_BYTES = psycopg2.extensions.new_type(
+    psycopg2.BINARY.values, 'BYTEA_AS_BYTES',
+    lambda value, cursor: None if value is None else bytes(psycopg2.BINARY(value, cursor)))
+
+
+def _copy_value(value) -> str:
+    """Render a value as a field of PostgreSQL's COPY text format."""
+    if value is None:
+        return '\\N'
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return '\\\\x' + bytes(value).hex()  # bytea hex input, backslash escaped
+    return (str(value)
+            .replace('\\', '\\\\')
+            .replace('\t', '\\t')
+            .replace('\n', '\\n')
+            .replace('\r', '\\r'))
+
+
 class PostgresMQTTClient:
     """PostgreSQL client for MQTT message storage and retrieval."""
 
-    def __init__(self, host: str, database: str, user: str, password: str, port: int = 5432):
-        """Initialize PostgreSQL connection.
+    def __init__(self, host: str, database: str, user: str, password: str, port: int = 5432,
+                 batch_size: int = 500, min_connections: int = 1, max_connections: int = 16,
+                 unlogged: bool = False):
+        """Initialize the PostgreSQL connection pool.
 
         Args:
             host (str): Database host
@@ -41,80 +92,247 @@ class PostgresMQTTClient:
             user (str): Database user
             password (str): Database password
             port (int): Database port (default: 5432)
+            batch_size (int): Rows per INSERT statement in create_messages_bulk (default: 500)
+            min_connections (int): Idle connections kept open (default: 1)
+            max_connections (int): Connections open at once (default: 16)
+            unlogged (bool): Create the table UNLOGGED, skipping WAL for faster
+                ingestion at the cost of losing its rows after a crash. Only
+                applies when the table is created (default: False)
         """
-        self.conn_params = {
-            'host': host,
-            'database': database,
-            'user': user,
-            'password': password,
-            'port': port
-        }
-        self.connection = None
+        # Build the libpq connection string once, not on every new connection
+        self.dsn = psycopg2.extensions.make_dsn(
+            host=host,
+            database=database,
+            user=user,
+            password=password,
+            port=port
+        )
+        self.min_connections = min_connections
+        self.max_connections = max_connections
+        self.unlogged = unlogged
+        self.pool = None
+        self._prepared = weakref.WeakSet()  # Connections with prepared statements
+        self._local = threading.local()  # Connection held by an open transaction()
+        self.batch_size = batch_size
         self._connect()
         self._create_table()
 
     def _connect(self) -> None:
-        """Establish database connection."""
+        """Create the connection pool."""
         try:
-            self.connection = psycopg2.connect(**self.conn_params)
-            self.connection.autocommit = False  # Ensure explicit transaction control
+            self.pool = ThreadedConnectionPool(
+                self.min_connections, self.max_connections, self.dsn)
         except psycopg2.Error as e:
             raise Exception(f"Failed to connect to database: {e}")
 
+    @contextmanager
+    def _conn(self):
+        """Check out a pooled connection, or reuse the one held by transaction()."""
+        held = getattr(self._local, 'connection', None)
+        if held is not None:
+            yield held
+            return
+
+        conn = self.pool.getconn()
+        if conn.closed:  # Dropped while idle in the pool
+            self.pool.putconn(conn, close=True)
+            conn = self.pool.getconn()
+        try:
+            if conn not in self._prepared:
+                self._prepare_statements(conn)
+            yield conn
+        finally:
+            # The pool rolls back whatever the caller left uncommitted
+            self.pool.putconn(conn, close=bool(conn.closed))
+
+    def _prepare_statements(self, conn) -> None:
+        """Prepare the repeated CRUD queries once per connection."""
+        try:
+            psycopg2.extensions.register_type(_BYTEA_AS_BYTES, conn)
+            with conn.cursor() as cursor:
+                cursor.execute(_SESSION_SETUP)
+                conn.commit()
+                self._prepared.add(conn)
+        except psycopg2.Error as e:
+            conn.rollback()
+            raise Exception(f"Failed to prepare statements: {e}")
+
     def _create_table(self) -> None:
         """Create MQTT messages table if it doesn't exist."""
-        create_table_query = """
-        DROP TABLE IF EXISTS mqtt_messages;
-        CREATE TABLE mqtt_messages (
+        create_table_query = f"""
+        CREATE {'UNLOGGED ' if self.unlogged else ''}TABLE IF NOT EXISTS mqtt_messages (
             id SERIAL PRIMARY KEY,
             topic VARCHAR(255) NOT NULL,
-            payload TEXT,
+            payload BYTEA,
             qos INTEGER,
             retain BOOLEAN DEFAULT FALSE,
             timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             client_id VARCHAR(128)
         );
         """
+        create_index_query = """
+        CREATE INDEX IF NOT EXISTS idx_mqtt_topic_ts
+            ON mqtt_messages (topic, timestamp DESC);
+        """
+        # Tables from older versions predate the index; to_regclass() checks
+        # for it without the lock CREATE INDEX takes even when it exists
+        index_exists_query = "SELECT to_regclass('idx_mqtt_topic_ts') IS NOT NULL;"
+        # Payloads used to be stored as TEXT; raw MQTT bytes need BYTEA
+        migrate_payload_query = """
+        ALTER TABLE mqtt_messages
+            ALTER COLUMN payload TYPE BYTEA USING convert_to(payload, 'UTF8');
+        """
+        # One probe tells apart a missing table, a legacy one and a current one
+        payload_type_query = """
+        SELECT data_type FROM information_schema.columns
+        WHERE table_schema = current_schema()
+          AND table_name = 'mqtt_messages' AND column_name = 'payload';
+        """
+        # Statements can't be prepared before the table exists, so bypass _conn()
+        conn = self.pool.getconn()
         try:
-            with self.connection.cursor() as cursor:
-                # Execute the create table query
-                cursor.execute(create_table_query)
+            with conn.cursor() as cursor:
+                # Skip the DDL entirely when the table is already current
+                cursor.execute(payload_type_query)
+                row = cursor.fetchone()
+                if row is None:
+                    # Execute the create table query
+                    cursor.execute(create_table_query)
+                    print("Table created successfully")
+                elif row[0] == 'text':
+                    cursor.execute(migrate_payload_query)
+                    print("Payload column migrated to BYTEA")
+                cursor.execute(index_exists_query)
+                if not cursor.fetchone()[0]:
+                    cursor.execute(create_index_query)
+                    print("Index idx_mqtt_topic_ts created")
                 # Explicitly commit the transaction
-                self.connection.commit()
-                print("Table created/reset successfully")
+                conn.commit()
         except psycopg2.Error as e:
-            self.connection.rollback()
+            conn.rollback()
             raise Exception(f"Failed to create table: {e}")
+        finally:
+            self.pool.putconn(conn)
 
-    def create_message(self, topic: str, payload: str, qos: int = 0,
-                       retain: bool = False, client_id: Optional[str] = None) -> int:
-        """Create a new MQTT message record."""
-        if not self.connection or self.connection.closed:
-            self._connect()
+    @property
+    def _in_txn(self) -> bool:
+        return getattr(self._local, 'connection', None) is not None
 
-        query = """
-        INSERT INTO mqtt_messages (topic, payload, qos, retain, client_id)
-        VALUES (%s, %s, %s, %s, %s)
-        RETURNING id;
+    @contextmanager
+    def transaction(self):
+        """Run several operations in one transaction, committed on exit.
+
+        The CRUD methods called from the same thread share the transaction's
+        connection and skip their own commit; any exception rolls the whole
+        block back. Nested blocks join the outer transaction.
         """
+        if self._in_txn:
+            yield self._local.connection
+            return
+
+        with self._conn() as conn:
+            self._local.connection = conn
+            try:
+                yield conn
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                self._local.connection = None
+
+    def _commit(self, conn) -> None:
+        """Commit unless an enclosing transaction() will do it."""
+        if not self._in_txn:
+            conn.commit()
+
+    def create_message(self, topic: str, payload: bytes, qos: int = 0,
+                       retain: bool = False, client_id: Optional[str] = None,
+                       timestamp: Optional[float] = None) -> int:
+        """Create a new MQTT message record.
+
+        timestamp is the receive time in seconds since the epoch; the
+        database fills in the current time when it is None.
+        """
+        query = "EXECUTE mqtt_insert (%s, %s, %s, %s, %s, %s);"
         try:
-            with self.connection.cursor() as cursor:
-                cursor.execute(query, (topic, payload, qos, retain, client_id))
+            with self._conn() as conn, conn.cursor() as cursor:
+                cursor.execute(query, (topic, payload, qos, retain, client_id, timestamp))
                 message_id = cursor.fetchone()[0]
-                self.connection.commit()
+                self._commit(conn)
                 return message_id
         except psycopg2.Error as e:
-            self.connection.rollback()
             raise Exception(f"Failed to create message: {e}")
 
+    def create_messages_bulk(self, rows: List[Tuple]) -> List[int]:
+        """Create many MQTT message records in one round-trip and one commit.
+
+        Args:
+            rows (list): (topic, payload, qos, retain, client_id, timestamp) tuples,
+                timestamp in seconds since the epoch or None for now
+
+        Returns:
+            list: IDs of the created records
+        """
+        if not rows:
+            return []
+
+        query = """
+        INSERT INTO mqtt_messages (topic, payload, qos, retain, client_id, timestamp)
+        VALUES %s
+        RETURNING id;
+        """
+        template = "(%s, %s, %s, %s, %s, COALESCE(to_timestamp(%s), CURRENT_TIMESTAMP))"
+        try:
+            with self._conn() as conn, conn.cursor() as cursor:
+                # fetch=True gathers RETURNING rows from every page, so large
+                # inputs can be split into bounded statements without losing IDs
+                results = execute_values(cursor, query, rows, template=template,
+                                         page_size=self.batch_size, fetch=True)
+                self._commit(conn)
+                return [row[0] for row in results]
+        except psycopg2.Error as e:
+            raise Exception(f"Failed to create messages: {e}")
+
+    def copy_messages(self, rows: List[Tuple]) -> int:
+        """Load many MQTT message records with COPY; IDs are not returned.
+
+        Args:
+            rows (list): (topic, payload, qos, retain, client_id, timestamp) tuples,
+                timestamp in seconds since the epoch or None for now
+
+        Returns:
+            int: Number of records loaded
+        """
+        if not rows:
+            return 0
+
+        # COPY can't call to_timestamp(), so receive times are rendered here
+        # as naive UTC, matching the UTC sessions set up in _prepare_statements
+        buffer = io.StringIO()
+        for *fields, timestamp in rows:
+            moment = (datetime.fromtimestamp(timestamp, timezone.utc) if timestamp is not None
+                      else datetime.now(timezone.utc))
+            fields.append(moment.replace(tzinfo=None))
+            buffer.write('\t'.join(map(_copy_value, fields)))
+            buffer.write('\n')
+        buffer.seek(0)
+
+        query = ("COPY mqtt_messages (topic, payload, qos, retain, client_id, timestamp) "
+                 "FROM STDIN")
+        try:
+            with self._conn() as conn, conn.cursor() as cursor:
+                cursor.copy_expert(query, buffer)
+                self._commit(conn)
+                return len(rows)
+        except psycopg2.Error as e:
+            raise Exception(f"Failed to copy messages: {e}")
+
     def read_message(self, message_id: int) -> Optional[Dict]:
         """Read a specific MQTT message."""
-        if not self.connection or self.connection.closed:
-            self._connect()
-
-        query = "SELECT * FROM mqtt_messages WHERE id = %s;"
+        query = "EXECUTE mqtt_read_by_id (%s);"
         try:
-            with self.connection.cursor(cursor_factory=RealDictCursor) as cursor:
+            with self._conn() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
                 cursor.execute(query, (message_id,))
                 return cursor.fetchone()
         except psycopg2.Error as e:
@@ -122,25 +340,19 @@ class PostgresMQTTClient:
 
     def read_messages_by_topic(self, topic: str, limit: int = 100) -> List[Dict]:
         """Read messages for a specific topic."""
-        if not self.connection or self.connection.closed:
-            self._connect()
-
-        query = "SELECT * FROM mqtt_messages WHERE topic = %s ORDER BY timestamp DESC LIMIT %s;"
+        query = "EXECUTE mqtt_read_by_topic (%s, %s);"
         try:
-            with self.connection.cursor(cursor_factory=RealDictCursor) as cursor:
+            with self._conn() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
                 cursor.execute(query, (topic, limit))
                 return cursor.fetchall()
         except psycopg2.Error as e:
             raise Exception(f"Failed to read messages: {e}")
 
     def update_message(self, message_id: int,
-                       payload: Optional[str] = None,
+                       payload: Optional[bytes] = None,
                        qos: Optional[int] = None,
                        retain: Optional[bool] = None) -> bool:
         """Update an existing MQTT message."""
-        if not self.connection or self.connection.closed:
-            self._connect()
-
         updates = []
         params = []
         if payload is not None:
@@ -164,51 +376,42 @@ class PostgresMQTTClient:
         params.append(message_id)
 
         try:
-            with self.connection.cursor() as cursor:
+            with self._conn() as conn, conn.cursor() as cursor:
                 cursor.execute(query, params)
                 rows_affected = cursor.rowcount
-                self.connection.commit()
+                self._commit(conn)
                 return rows_affected > 0
         except psycopg2.Error as e:
-            self.connection.rollback()
             raise Exception(f"Failed to update message: {e}")
 
     def delete_message(self, message_id: int) -> bool:
         """Delete a specific MQTT message."""
-        if not self.connection or self.connection.closed:
-            self._connect()
-
-        query = "DELETE FROM mqtt_messages WHERE id = %s;"
+        query = "EXECUTE mqtt_delete_by_id (%s);"
         try:
-            with self.connection.cursor() as cursor:
+            with self._conn() as conn, conn.cursor() as cursor:
                 cursor.execute(query, (message_id,))
                 rows_affected = cursor.rowcount
-                self.connection.commit()
+                self._commit(conn)
                 return rows_affected > 0
         except psycopg2.Error as e:
-            self.connection.rollback()
             raise Exception(f"Failed to delete message: {e}")
 
     def delete_messages_by_topic(self, topic: str) -> int:
         """Delete all messages for a specific topic."""
-        if not self.connection or self.connection.closed:
-            self._connect()
-
-        query = "DELETE FROM mqtt_messages WHERE topic = %s;"
+        query = "EXECUTE mqtt_delete_by_topic (%s);"
         try:
-            with self.connection.cursor() as cursor:
+            with self._conn() as conn, conn.cursor() as cursor:
                 cursor.execute(query, (topic,))
                 rows_affected = cursor.rowcount
-                self.connection.commit()
+                self._commit(conn)
                 return rows_affected
         except psycopg2.Error as e:
-            self.connection.rollback()
             raise Exception(f"Failed to delete messages: {e}")
 
     def close(self) -> None:
-        """Close the database connection."""
-        if self.connection:
-            self.connection.close()
+        """Close all pooled connections."""
+        if self.pool and not self.pool.closed:
+            self.pool.closeall()
 
 
 def main():
@@ -233,7 +436,7 @@ def main():
         # Create some test messages
         message_id1 = client.create_message(
             topic="sensors/temperature",
-            payload="25.5",
+            payload=b"25.5",
             qos=1,
             retain=True,
             client_id="sensor1"
@@ -242,7 +445,7 @@ def main():
 
         message_id2 = client.create_message(
             topic="sensors/humidity",
-            payload="65",
+            payload=b"65",
             qos=1,
             client_id="sensor1"
         )
@@ -259,7 +462,7 @@ def main():
         # Update a message
         updated = client.update_message(
             message_id1,
-            payload="26.0",
+            payload=b"26.0",
             qos=2
         )
         print(f"Message update successful: {updated}")
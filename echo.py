@@ -1,11 +1,13 @@
 import json
 import logging
 from dotenv import load_dotenv
-import os
+import signal
 import sys
+import threading
+import time
 from datetime import datetime
 
-from mqtt_client.config import ConfigurationManager
+from mqtt_client.config import ConfigurationManager, MqttEnv
 from mqtt_client.ssl_context import HiveMQSSLContextFactory
 from mqtt_client.message_handler import DefaultMessageHandler, Message
 from mqtt_client.connection_handler import DefaultConnectionHandler
@@ -16,25 +18,31 @@ class EchoMessageHandler(DefaultMessageHandler):
     """Message handler that echoes messages to console"""
 
     def handle_message(self, message: Message) -> None:
-        # Call parent method to maintain message history
-        super().handle_message(message)
+        # The printed block below replaces the parent's history and log
+        # records, so the parent handler is deliberately not called
 
         # Pretty print the message
-        try:
-            # Try to parse as JSON for prettier output
-            payload = json.loads(message.payload)
-            payload_str = json.dumps(payload, indent=2)
-        except json.JSONDecodeError:
-            # If not JSON, use raw payload
-            payload_str = message.payload
-
-        print("\n=== New Message ===")
-        print(f"Timestamp: {message.timestamp}")
-        print(f"Topic: {message.topic}")
-        print(f"QoS: {message.qos}")
-        print("Payload:")
-        print(payload_str)
-        print("=================\n")
+        payload_str = message.payload.decode(errors='replace')
+        # Only objects and arrays gain from re-indenting, so skip the
+        # parse (and its exception) for everything else
+        if payload_str.lstrip()[:1] in ('{', '['):
+            try:
+                payload = json.loads(payload_str)
+                payload_str = json.dumps(payload, indent=2)
+            except json.JSONDecodeError:
+                # If not JSON, use raw payload
+                pass
+
+        # One write per message instead of one per line
+        sys.stdout.write(
+            "\n=== New Message ===\n"
+            f"Timestamp: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(message.timestamp))}\n"
+            f"Topic: {message.topic}\n"
+            f"QoS: {message.qos}\n"
+            "Payload:\n"
+            f"{payload_str}\n"
+            "=================\n\n"
+        )
 
 
 def main():
@@ -43,22 +51,19 @@ def main():
         load_dotenv()
         logging.basicConfig(level=logging.DEBUG)
 
-        with open('cert.pem', 'r') as cert_file:
-            cert_content = cert_file.read()
-
         # Initialize configuration
-        config_manager = config_manager = ConfigurationManager(
-            mqtt_broker=os.getenv('MQTT_BROKER'),
-            mqtt_username=os.getenv('MQTT_USERNAME_2'),
-            mqtt_password=os.getenv('MQTT_PASSWORD_2'),
-            hivemq_cloud_cert=cert_content,
-            mqtt_port=int(os.getenv('MQTT_PORT', '8883')),
-            mqtt_client_id=os.getenv('MQTT_CLIENT_ID_2')
+        env = MqttEnv.from_env(suffix="_2")
+        config_manager = ConfigurationManager(
+            mqtt_broker=env.broker,
+            mqtt_username=env.username,
+            mqtt_password=env.password,
+            mqtt_port=env.port,
+            mqtt_client_id=env.client_id
         )
         mqtt_config = config_manager.get_mqtt_config()
 
         # Create components
-        ssl_factory = HiveMQSSLContextFactory(mqtt_config['cert'])
+        ssl_factory = HiveMQSSLContextFactory.from_pem_file('cert.pem')
         message_handler = EchoMessageHandler()
         connection_handler = DefaultConnectionHandler()
 
@@ -77,9 +82,12 @@ def main():
             # Subscribe to all messages using wildcard
             client.subscribe("#")  # Subscribe to all topics
 
-            # Keep the script running
-            while True:
-                pass
+            # Sleep until a shutdown signal arrives
+            stop = threading.Event()
+            signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+            signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+            stop.wait()
+            print("\nShutting down...")
 
         else:
             logging.error("Failed to establish connection")
@@ -1,134 +1,257 @@
-from queue import Queue, Empty
+from collections import deque
 import signal
-import json
 import logging
 from dotenv import load_dotenv
 import os
+import random
 import sys
 from datetime import datetime
 import threading
-from typing import Optional, Dict
+import time
+from typing import Optional, List, Tuple
 
-from mqtt_client.config import ConfigurationManager
+import psycopg2
+
+from mqtt_client.config import ConfigurationManager, MqttEnv
 from mqtt_client.ssl_context import HiveMQSSLContextFactory
 from mqtt_client.message_handler import DefaultMessageHandler, Message
 from mqtt_client.connection_handler import DefaultConnectionHandler
 from mqtt_client.mqtt_client import MQTTClientWrapper
+from database import PostgresMQTTClient, parse_db_url
+
+# Database writer threads in the bridge; must be a power of two
+WORKERS = 4
+
+
+class DropOldestQueue:
+    """Bounded FIFO that evicts the oldest item instead of rejecting new ones
+
+    deque append/popleft are atomic, so the paho network thread never takes a
+    lock to enqueue; an Event only wakes the consumer when it is idle.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._items = deque(maxlen=maxsize)
+        self._ready = threading.Event()
+        self._closed = False
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def put(self, item) -> bool:
+        """Append item; returns True if the oldest item was evicted to make room"""
+        evicted = len(self._items) == self.maxsize
+        self._items.append(item)
+        # Event.set() locks internally; skip it while the consumer is already awake
+        if not self._ready.is_set():
+            self._ready.set()
+        return evicted
+
+    def get_batch(self, limit: int, timeout: Optional[float] = None) -> list:
+        """Wait until items are available (or timeout/close), then take up to limit"""
+        if not self._items and not self._closed:
+            self._ready.clear()
+            # Re-check after clearing: a put() or close() that landed before the
+            # clear saw the flag still set and won't set it again
+            if not self._items and not self._closed:
+                self._ready.wait(timeout)
+        batch = []
+        try:
+            while len(batch) < limit:
+                batch.append(self._items.popleft())
+        except IndexError:
+            pass
+        return batch
+
+    def close(self) -> None:
+        """Wake every waiter; get_batch stops blocking from now on"""
+        self._closed = True
+        self._ready.set()
 
 
 class OptimizedMessageHandler(DefaultMessageHandler):
     """Message handler with memory management and async processing"""
 
-    def __init__(self, db_client, max_queue_size: int = 1000):
+    def __init__(self, db_client, max_queue_size: int = 1000, batch_size: int = 500,
+                 batch_window: float = 0.05, workers: int = 1):
         super().__init__()
+        if workers < 1 or workers & (workers - 1):
+            raise ValueError(f"workers must be a power of two, got {workers}")
         self.db_client = db_client
-        self.message_queue = Queue(maxsize=max_queue_size)
+        # One queue and writer thread per shard; a topic always maps to the same
+        # shard, so per-topic ordering is kept. Each shard holds max_queue_size so
+        # one hot topic gets the same headroom as before. On overflow the oldest
+        # message goes, so the freshest data survives a DB stall
+        self._shard_mask = workers - 1
+        self.queues = [DropOldestQueue(max_queue_size) for _ in range(workers)]
+        self.batch_size = batch_size
+        self.batch_window = batch_window
         self.running = True
 
-        # Start processing thread
-        self.worker = threading.Thread(target=self._process_messages)
-        self.worker.daemon = True
-        self.worker.start()
-
-        # Message tracking
-        self.processed_count = 0
-        self.dropped_count = 0
+        # Message tracking, one slot per shard so each counter has a single writer:
+        # _dropped is bumped by the MQTT thread, _processed/_rejected by the worker
+        self._processed = [0] * workers
+        self._dropped = [0] * workers
+        self._rejected = [0] * workers
         self.last_log_time = datetime.now()
+        self._stats_lock = threading.Lock()
+
+        # Start processing threads
+        self.workers = [
+            threading.Thread(target=self._process_messages, args=(shard,), daemon=True)
+            for shard in range(workers)
+        ]
+        for worker in self.workers:
+            worker.start()
+
+    @property
+    def processed_count(self) -> int:
+        return sum(self._processed)
+
+    @property
+    def dropped_count(self) -> int:
+        return sum(self._dropped) + sum(self._rejected)
 
     def handle_message(self, message: Message) -> None:
         try:
-            if not self.message_queue.full():
-                self.message_queue.put_nowait(message)
-            else:
-                self.dropped_count += 1
-                if self.dropped_count % 100 == 0:
+            shard = hash(message.topic) & self._shard_mask
+            if self.queues[shard].put(message):
+                self._dropped[shard] += 1
+                if self._dropped[shard] % 100 == 0:
                     logging.warning(
-                        f"Dropped {self.dropped_count} messages - queue full")
+                        "Dropped %d oldest messages from shard %d - queue full",
+                        self._dropped[shard], shard)
 
         except Exception as e:
-            logging.error(f"Error queuing message: {e}")
+            logging.error("Error queuing message: %s", e)
 
-    def _process_messages(self):
-        """Background thread for message processing"""
+    def _process_messages(self, shard: int):
+        """Background thread draining one shard's queue into batched inserts"""
+        queue = self.queues[shard]
         while self.running:
+            # Block until messages arrive; shutdown() closes the queue to wake us
+            batch = queue.get_batch(self.batch_size)
+            if not batch:
+                continue
+
             try:
-                # Get message with timeout to allow checking running flag
-                message = self.message_queue.get(timeout=1.0)
+                # Give a burst a short window to fill the batch
+                self._collect(queue, batch, self.batch_window)
 
                 # Store in database
-                self._store_message(message)
-                self.processed_count += 1
-
-                # Log statistics periodically
-                current_time = datetime.now()
-                if (current_time - self.last_log_time).total_seconds() >= 60:
-                    self._log_statistics()
-                    self.last_log_time = current_time
-
-            except Empty:  # Use the imported Empty exception
-                continue  # No messages to process
+                stored = self._store_messages(batch)
             except Exception as e:
-                logging.error(f"Error processing message: {e}")
-
-    def _store_message(self, message: Message):
-        """Store single message with retry logic"""
+                stored = 0
+                logging.error("Error processing messages: %s", e)
+            # Whatever wasn't stored is lost, so count it as dropped
+            self._processed[shard] += stored
+            self._rejected[shard] += len(batch) - stored
+
+            # Log statistics periodically, from whichever worker gets there first
+            current_time = datetime.now()
+            with self._stats_lock:
+                due = (current_time - self.last_log_time).total_seconds() >= 60
+                if due:
+                    self.last_log_time = current_time
+            if due:
+                self._log_statistics()
+
+    def _collect(self, queue: DropOldestQueue, batch: List[Message], window: float) -> None:
+        """Top batch up to batch_size, waiting at most window seconds in total"""
+        deadline = time.monotonic() + window
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            more = queue.get_batch(self.batch_size - len(batch), timeout=remaining)
+            if not more:  # Window elapsed or queue closed
+                break
+            batch.extend(more)
+
+    def _store_messages(self, messages: List[Message]) -> int:
+        """Stream a batch of messages with COPY; returns how many were stored"""
+        rows = [
+            (message.topic, message.payload, message.qos, False,
+             getattr(message, 'client_id', None), message.timestamp)
+            for message in messages
+        ]
+        stored, _ = self._copy_rows(rows)
+        return stored
+
+    def _copy_rows(self, rows: List[tuple]) -> Tuple[int, bool]:
+        """COPY rows with retry logic, splitting around rows the database rejects
+
+        Returns how many rows were stored, and False if the database failed as a
+        whole, so the caller stops sending it the rest of the batch.
+        """
         max_retries = 3
         retry_count = 0
 
-        while retry_count < max_retries:
+        while True:
             try:
-                self.db_client.create_message(
-                    topic=message.topic,
-                    payload=message.payload,
-                    qos=message.qos,
-                    retain=False,
-                    client_id=getattr(message, 'client_id', None)
-                )
-                return
+                # The bridge never needs the generated IDs, so skip RETURNING
+                self.db_client.copy_messages(rows)
+                return len(rows), True
             except Exception as e:
+                # The DB client wraps driver errors in a plain Exception
+                cause = e.__context__
+                if isinstance(cause, (psycopg2.DataError, psycopg2.IntegrityError)):
+                    # A row-level error: COPY is all-or-nothing, so bisect until
+                    # only the bad rows are left
+                    if len(rows) == 1:
+                        logging.error("Dropping message on topic %.80s: %s", rows[0][0], e)
+                        return 0, True
+                    mid = len(rows) // 2
+                    stored, ok = self._copy_rows(rows[:mid])
+                    if not ok:
+                        return stored, False
+                    more, ok = self._copy_rows(rows[mid:])
+                    return stored + more, ok
+
                 retry_count += 1
-                if retry_count == max_retries:
-                    logging.error(
-                        f"Failed to store message after {max_retries} attempts")
-                    raise
-                logging.warning(f"Retry {retry_count} for message storage")
+                # Only a lost or unreachable server is worth retrying; schema,
+                # permission or read-only errors fail every row the same way
+                if (not isinstance(cause, (psycopg2.OperationalError,
+                                           psycopg2.InterfaceError))
+                        or retry_count == max_retries):
+                    logging.error("Failed to store %d messages after %d attempts: %s",
+                                  len(rows), retry_count, e)
+                    return 0, False
+                # Back off exponentially with jitter so an outage isn't hammered
+                delay = min(0.05 * 2 ** retry_count, 2.0) + random.random() * 0.05
+                logging.warning("Retry %d for message storage in %.2fs", retry_count, delay)
+                time.sleep(delay)
 
     def _log_statistics(self):
         """Log processing statistics"""
         logging.info(
-            f"Messages - Processed: {self.processed_count}, "
-            f"Queued: {self.message_queue.qsize()}, "
-            f"Dropped: {self.dropped_count}"
+            "Messages - Processed: %d, Queued: %d, Dropped: %d",
+            self.processed_count, sum(map(len, self.queues)), self.dropped_count
         )
 
     def shutdown(self):
         """Graceful shutdown of message processing"""
         self.running = False
-        self.worker.join(timeout=5.0)
+        for queue in self.queues:
+            queue.close()  # Wake the workers so they see running is False
+        for worker in self.workers:
+            worker.join(timeout=5.0)
 
         # Process remaining messages
-        remaining = self.message_queue.qsize()
+        remaining = sum(map(len, self.queues))
         if remaining > 0:
-            logging.info(f"Processing {remaining} remaining messages...")
-            while not self.message_queue.empty():
-                try:
-                    message = self.message_queue.get_nowait()
-                    self._store_message(message)
-                except Exception as e:
-                    logging.error(f"Error processing final message: {e}")
-
-
-def parse_db_url(url: str) -> Dict[str, str]:
-    """Parse database URL into connection parameters."""
-    from urllib.parse import urlparse
-    parsed = urlparse(url)
-    return {
-        'host': parsed.hostname,
-        'database': parsed.path[1:],
-        'user': parsed.username,
-        'password': parsed.password,
-        'port': parsed.port or 5432
-    }
+            logging.info("Processing %d remaining messages...", remaining)
+            for shard, queue in enumerate(self.queues):
+                while len(queue):
+                    batch = queue.get_batch(self.batch_size)
+                    try:
+                        stored = self._store_messages(batch)
+                    except Exception as e:
+                        stored = 0
+                        logging.error("Error processing final messages: %s", e)
+                    self._processed[shard] += stored
+                    self._rejected[shard] += len(batch) - stored
 
 
 def main():
@@ -141,29 +264,28 @@ def main():
         if not db_url:
             raise ValueError("DB_URL environment variable not set")
 
-        # Initialize database client
-        from database import PostgresMQTTClient
-        db_client = PostgresMQTTClient(**parse_db_url(db_url))
+        # Initialize database client. The pool only keeps min_connections idle
+        # and closes the rest, so keep one per writer to avoid reconnecting
+        # (and re-preparing statements) between batches
+        db_client = PostgresMQTTClient(
+            **parse_db_url(db_url), min_connections=WORKERS, max_connections=2 * WORKERS)
         logging.info("Successfully connected to database")
 
-        with open('cert.pem', 'r') as cert_file:
-            cert_content = cert_file.read()
-
         # Initialize MQTT configuration
+        env = MqttEnv.from_env()
         config_manager = ConfigurationManager(
-            mqtt_broker=os.getenv('MQTT_BROKER'),
-            mqtt_client_id=os.getenv('MQTT_CLIENT_ID'),
-            mqtt_username=os.getenv('MQTT_USERNAME'),
-            mqtt_password=os.getenv('MQTT_PASSWORD'),
-            hivemq_cloud_cert=cert_content,
-            mqtt_port=int(os.getenv('MQTT_PORT', '8883'))
+            mqtt_broker=env.broker,
+            mqtt_client_id=env.client_id,
+            mqtt_username=env.username,
+            mqtt_password=env.password,
+            mqtt_port=env.port
         )
         mqtt_config = config_manager.get_mqtt_config()
 
         # Create MQTT components
-        ssl_factory = HiveMQSSLContextFactory(mqtt_config['cert'])
+        ssl_factory = HiveMQSSLContextFactory.from_pem_file('cert.pem')
         message_handler = OptimizedMessageHandler(
-            db_client, max_queue_size=1000)
+            db_client, max_queue_size=1000, workers=WORKERS)
         connection_handler = DefaultConnectionHandler()
 
         # Create and connect MQTT client
@@ -174,25 +296,22 @@ def main():
             connection_handler
         )
 
-        def handle_shutdown(signum, frame):
-            """Handle graceful shutdown"""
-            print("\nShutting down...")
-            message_handler.shutdown()
-            mqtt_client.disconnect()
-            db_client.close()
-            print("Bridge shutdown complete")
-            sys.exit(0)
-
-        signal.signal(signal.SIGINT, handle_shutdown)
-        signal.signal(signal.SIGTERM, handle_shutdown)
+        # Disconnecting ends loop_forever(); shutdown then runs on the main thread
+        signal.signal(signal.SIGINT, lambda signum, frame: mqtt_client.client.disconnect())
+        signal.signal(signal.SIGTERM, lambda signum, frame: mqtt_client.client.disconnect())
 
-        if mqtt_client.connect():
+        # paho runs on this thread rather than its own, leaving one less thread
+        # contending for the GIL with the database writers
+        if mqtt_client.connect(background=False):
             print("\nConnected to MQTT broker and database successfully!")
             print("Listening for messages and storing them... (Press Ctrl+C to exit)\n")
 
             mqtt_client.subscribe("#")
 
-            signal.pause()
+            mqtt_client.loop_forever()
+            print("\nShutting down...")
+            # Intake has stopped; drain the queue before the pool is closed
+            message_handler.shutdown()
         else:
             logging.error("Failed to establish MQTT connection")
             sys.exit(1)
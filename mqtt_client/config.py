@@ -1,6 +1,30 @@
 import logging
+import os
 import sys
-from typing import Dict, Optional
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Mapping, Optional
+
+
+@dataclass(frozen=True, slots=True)
+class MqttEnv:
+    """MQTT settings read from the environment once per process"""
+    broker: Optional[str]
+    port: int
+    username: Optional[str]
+    password: Optional[str]
+    client_id: Optional[str]
+
+    @classmethod
+    def from_env(cls, suffix: str = "") -> "MqttEnv":
+        """Read the MQTT_* variables; suffix picks an alternate credential set (e.g. "_2")"""
+        return cls(
+            broker=os.getenv('MQTT_BROKER'),
+            port=int(os.getenv('MQTT_PORT', '8883')),
+            username=os.getenv(f'MQTT_USERNAME{suffix}'),
+            password=os.getenv(f'MQTT_PASSWORD{suffix}'),
+            client_id=os.getenv(f'MQTT_CLIENT_ID{suffix}')
+        )
 
 
 class ConfigurationManager:
@@ -11,7 +35,6 @@ class ConfigurationManager:
         mqtt_broker: str,
         mqtt_username: str,
         mqtt_password: str,
-        hivemq_cloud_cert: str,
         mqtt_port: int = 8883,
         mqtt_client_id: Optional[str] = None,
         logging_level: int = logging.DEBUG
@@ -20,7 +43,6 @@ class ConfigurationManager:
         self.mqtt_broker = mqtt_broker.strip() if mqtt_broker else None
         self.mqtt_username = mqtt_username.strip() if mqtt_username else None
         self.mqtt_password = mqtt_password.strip() if mqtt_password else None
-        self.hivemq_cloud_cert = hivemq_cloud_cert
         self.mqtt_port = mqtt_port
         self.mqtt_client_id = mqtt_client_id
         self.logging_level = logging_level
@@ -28,6 +50,15 @@ class ConfigurationManager:
         self._validate_configuration()
         self.setup_logging()
 
+        # Validated once, then shared read-only with every caller
+        self._mqtt_config = MappingProxyType({
+            'broker': self.mqtt_broker,
+            'port': self.mqtt_port,
+            'username': self.mqtt_username,
+            'password': self.mqtt_password,
+            'client_id': self.mqtt_client_id
+        })
+
     def _validate_configuration(self) -> None:
         errors = []
 
@@ -37,8 +68,6 @@ class ConfigurationManager:
             errors.append("MQTT_USERNAME is empty or not set")
         if not self.mqtt_password:
             errors.append("MQTT_PASSWORD is empty or not set")
-        if not self.hivemq_cloud_cert:
-            errors.append("HIVEMQ_CLOUD_CERT is empty or not set")
 
         # Validate broker URL format
         if self.mqtt_broker and not self.mqtt_broker.endswith('.hivemq.cloud'):
@@ -51,17 +80,17 @@ class ConfigurationManager:
 
         if errors:
             for error in errors:
-                logging.error(f"Configuration error: {error}")
+                logging.error("Configuration error: %s", error)
             raise ValueError("Invalid configuration. Check logs for details.")
 
         # Log successful validation
         logging.info("Configuration validation successful")
-        logging.debug(f"Using broker: {self.mqtt_broker}")
-        logging.debug(f"Using port: {self.mqtt_port}")
+        logging.debug("Using broker: %s", self.mqtt_broker)
+        logging.debug("Using port: %s", self.mqtt_port)
         logging.debug(
-            f"Username length: {len(self.mqtt_username) if self.mqtt_username else 0}")
+            "Username length: %d", len(self.mqtt_username) if self.mqtt_username else 0)
         logging.debug(
-            f"Password length: {len(self.mqtt_password) if self.mqtt_password else 0}")
+            "Password length: %d", len(self.mqtt_password) if self.mqtt_password else 0)
 
     def setup_logging(self) -> None:
         logging.basicConfig(
@@ -69,14 +98,5 @@ class ConfigurationManager:
             format='%(asctime)s - %(levelname)s - %(message)s'
         )
 
-    def get_mqtt_config(self) -> Dict[str, str]:
-        logging.debug(
-            f"Certificate starts with: {self.hivemq_cloud_cert[:50]}")
-        return {
-            'broker': self.mqtt_broker,
-            'port': self.mqtt_port,
-            'username': self.mqtt_username,
-            'password': self.mqtt_password,
-            'cert': self.hivemq_cloud_cert,
-            'client_id': self.mqtt_client_id
-        }
+    def get_mqtt_config(self) -> Mapping[str, Any]:
+        return self._mqtt_config
@@ -3,20 +3,7 @@ from paho.mqtt.client import ReasonCodes
 from abc import ABC, abstractmethod
 from typing import Dict, Any, Optional
 import logging
-
-
-class ConnectionHandler(ABC):
-    """Abstract base class for connection handling"""
-    @abstractmethod
-    def on_connect(self, client: Any, userdata: Any, flags: Dict, rc: int, properties: Optional[Dict] = None) -> None:
-        pass
-
-    @abstractmethod
-    def on_disconnect(self, client: Any, userdata: Any, rc: int, properties: Optional[Dict] = None) -> None:
-        pass
-
-
-# connection_handler.py
+import threading
 
 
 class ConnectionHandler(ABC):
@@ -35,7 +22,9 @@ class DefaultConnectionHandler(ConnectionHandler):
 
     def __init__(self):
         self.connected = False
-        self.subscribed_topics = set()
+        self.subscribed_topics: Dict[str, int] = {}  # topic -> QoS
+        # Set whenever the broker answers a CONNECT, successfully or not
+        self.connack_event = threading.Event()
 
     def on_connect(self, client: Any, userdata: Any, flags: Dict, rc: Any, properties: Optional[Dict] = None) -> None:
         # For MQTT v5, rc is a ReasonCode object
@@ -52,18 +41,21 @@ class DefaultConnectionHandler(ConnectionHandler):
 
         if rc_value == 0:
             self.connected = True
-            logging.info(f"Connected to HiveMQ Cloud: {connection_codes.get(rc_value, 'Unknown status')}")
-            for topic in self.subscribed_topics:
-                logging.info(f"Resubscribing to topic: {topic}")
-                client.subscribe(topic)
+            logging.info("Connected to HiveMQ Cloud: %s", connection_codes.get(rc_value, 'Unknown status'))
+            if self.subscribed_topics:
+                # A single SUBSCRIBE packet carries every topic
+                logging.info("Resubscribing to topics: %s", ', '.join(self.subscribed_topics))
+                client.subscribe(list(self.subscribed_topics.items()))
         else:
             self.connected = False
             error_msg = connection_codes.get(
                 rc_value, f"Unknown error code: {rc_value}")
-            logging.error(f"Connection failed: {error_msg}")
+            logging.error("Connection failed: %s", error_msg)
+
+        self.connack_event.set()
 
     def on_disconnect(self, client: Any, userdata: Any, rc: int, properties: Optional[Dict] = None) -> None:
         self.connected = False
         if rc != 0:
-            logging.warning(f"Unexpected disconnection (code: {rc})")
+            logging.warning("Unexpected disconnection (code: %s)", rc)
         logging.info("Disconnected from HiveMQ Cloud")
@@ -1,5 +1,6 @@
+from collections import deque
 from datetime import datetime
-from typing import List, Optional
+from typing import Deque, List, Optional
 import threading
 from queue import Queue
 from abc import ABC, abstractmethod
@@ -8,12 +9,12 @@ from typing import List, Dict, Any
 import logging
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Message:
     """Data class for MQTT messages"""
     topic: str
-    payload: str
-    timestamp: str
+    payload: bytes  # Raw MQTT payload; decode only where text is needed
+    timestamp: float  # Receive time, seconds since the epoch
     qos: int
 
 
@@ -27,11 +28,14 @@ class MessageHandler(ABC):
 class DefaultMessageHandler(MessageHandler):
     """Default implementation of message handling"""
 
-    def __init__(self):
-        self.message_history: List[Message] = []
+    def __init__(self, max_history: int = 1024):
+        # Keep only the most recent messages so wildcard subscriptions can't grow it forever
+        self.message_history: Deque[Message] = deque(maxlen=max_history)
 
     def handle_message(self, message: Message) -> None:
         self.message_history.append(message)
         logging.info(
-            f"Message received - Topic: {message.topic}, QoS: {message.qos}")
-        logging.debug(f"Message payload: {message.payload}")
+            "Message received - Topic: %s, QoS: %s", message.topic, message.qos)
+        # Payloads can be large; don't build the record unless DEBUG is on
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug("Message payload: %s", message.payload.decode(errors='replace'))
@@ -1,21 +1,29 @@
 import paho.mqtt.client as mqtt
 import time
-from datetime import datetime
-import json
 import logging
-from typing import Dict, Any, Optional
+from typing import Any, Mapping, Optional, Sequence
 
 from mqtt_client.ssl_context import SSLContextFactory
 from mqtt_client.message_handler import MessageHandler, Message
 from mqtt_client.connection_handler import ConnectionHandler
 
 
+# paho log levels mapped to logging levels
+_MQTT_LOG_LEVELS = {
+    mqtt.MQTT_LOG_INFO: logging.INFO,
+    mqtt.MQTT_LOG_NOTICE: logging.INFO,
+    mqtt.MQTT_LOG_WARNING: logging.WARNING,
+    mqtt.MQTT_LOG_ERR: logging.ERROR,
+    mqtt.MQTT_LOG_DEBUG: logging.DEBUG
+}
+
+
 class MQTTClientWrapper:
     """Main MQTT client wrapper implementing high-level MQTT operations"""
 
     def __init__(
         self,
-        config: Dict[str, str],
+        config: Mapping[str, Any],
         ssl_factory: SSLContextFactory,
         message_handler: MessageHandler,
         connection_handler: ConnectionHandler
@@ -46,45 +54,56 @@ class MQTTClientWrapper:
         try:
             message = Message(
                 topic=msg.topic,
-                payload=msg.payload.decode(),
-                timestamp=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                payload=msg.payload,
+                timestamp=time.time(),
                 qos=msg.qos
             )
             self.message_handler.handle_message(message)
         except Exception as e:
-            logging.error(f"Error processing message: {str(e)}")
+            logging.error("Error processing message: %s", e)
 
     def _on_log(self, client: Any, userdata: Any, level: int, buf: str) -> None:
-        levels = {
-            mqtt.MQTT_LOG_INFO: logging.INFO,
-            mqtt.MQTT_LOG_NOTICE: logging.INFO,
-            mqtt.MQTT_LOG_WARNING: logging.WARNING,
-            mqtt.MQTT_LOG_ERR: logging.ERROR,
-            mqtt.MQTT_LOG_DEBUG: logging.DEBUG
-        }
-        logging.log(levels.get(level, logging.DEBUG), f"MQTT Log: {buf}")
-
-    def connect(self) -> bool:
+        lvl = _MQTT_LOG_LEVELS.get(level, logging.DEBUG)
+        # paho calls this for every packet; bail out before building a record
+        if logging.getLogger().isEnabledFor(lvl):
+            logging.log(lvl, "MQTT Log: %s", buf)
+
+    def connect(self, background: bool = True) -> bool:
+        """Connect and wait for CONNACK; background=False leaves the network loop to the caller"""
         try:
-            logging.info(f"Initiating connection to {self.config['broker']}:{self.config['port']}")
+            logging.info("Initiating connection to %s:%s", self.config['broker'], self.config['port'])
+            self.connection_handler.connack_event.clear()
             self.client.connect(
                 self.config['broker'], self.config['port'], keepalive=60)
-            self.client.loop_start()
-
-            timeout = time.time() + 10
-            while not self.connection_handler.connected and time.time() < timeout:
-                time.sleep(0.1)
-
-            if not self.connection_handler.connected:
-                logging.error("Connection timeout after 10 seconds")
-                return False
 
-            return True
+            if background:
+                self.client.loop_start()
+                if not self.connection_handler.connack_event.wait(timeout=10):
+                    logging.error("Connection timeout after 10 seconds")
+                    return False
+            else:
+                # No network thread yet, so pump the socket here until the broker answers
+                deadline = time.monotonic() + 10
+                while not self.connection_handler.connack_event.is_set():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        logging.error("Connection timeout after 10 seconds")
+                        return False
+                    rc = self.client.loop(timeout=min(remaining, 1.0))
+                    if rc != mqtt.MQTT_ERR_SUCCESS:
+                        logging.error("Connection failed: %s", mqtt.error_string(rc))
+                        return False
+
+            return self.connection_handler.connected
 
         except Exception as e:
-            logging.error(f"Connection failed: {str(e)}")
+            logging.error("Connection failed: %s", e)
             return False
 
+    def loop_forever(self) -> None:
+        """Run the network loop on the calling thread until disconnect() is called"""
+        self.client.loop_forever()
+
     def disconnect(self) -> None:
         logging.info("Initiating disconnect...")
         self.client.loop_stop()
@@ -102,15 +121,41 @@ class MQTTClientWrapper:
             result = self.client.publish(topic, message, qos=qos)
 
             if result[0] == 0:
-                logging.info(f"Published successfully to {topic}")
-                logging.debug(f"Message: {message}")
+                logging.info("Published successfully to %s", topic)
+                logging.debug("Message: %s", message)
                 return True
             else:
-                logging.error(f"Failed to publish message (code: {result[0]})")
+                logging.error("Failed to publish message (code: %s)", result[0])
                 return False
 
         except Exception as e:
-            logging.error(f"Publishing error: {str(e)}")
+            logging.error("Publishing error: %s", e)
+            return False
+
+    def publish_many(self, topic: str, messages: Sequence[Any], qos: int = 1) -> bool:
+        """Publish several messages to one topic back to back, checking the connection once"""
+        try:
+            if not self.connection_handler.connected:
+                logging.warning("Not connected. Attempting to reconnect...")
+                if not self.connect():
+                    logging.error("Reconnection failed")
+                    return False
+
+            # paho only queues each packet; the network loop flushes them together
+            failed = 0
+            for message in messages:
+                if self.client.publish(topic, message, qos=qos)[0] != 0:
+                    failed += 1
+
+            if failed:
+                logging.error("Failed to publish %d of %d messages to %s",
+                              failed, len(messages), topic)
+                return False
+            logging.info("Published %d messages successfully to %s", len(messages), topic)
+            return True
+
+        except Exception as e:
+            logging.error("Publishing error: %s", e)
             return False
 
     def subscribe(self, topic: str, qos: int = 1) -> bool:
@@ -118,13 +163,13 @@ class MQTTClientWrapper:
             result = self.client.subscribe(topic, qos)
 
             if result[0] == 0:
-                self.connection_handler.subscribed_topics.add(topic)
-                logging.info(f"Subscribed successfully to {topic}")
+                self.connection_handler.subscribed_topics[topic] = qos
+                logging.info("Subscribed successfully to %s", topic)
                 return True
             else:
-                logging.error(f"Failed to subscribe to {topic} (code: {result[0]})")
+                logging.error("Failed to subscribe to %s (code: %s)", topic, result[0])
                 return False
 
         except Exception as e:
-            logging.error(f"Subscription error: {str(e)}")
+            logging.error("Subscription error: %s", e)
             return False
@@ -2,6 +2,8 @@
 import ssl
 import logging
 from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import Optional
 import re
 
 
@@ -12,58 +14,76 @@ class SSLContextFactory(ABC):
         pass
 
 
+# Splits a PEM body line into 64-column chunks
+_LINE64 = re.compile(r'.{1,64}')
+
+
+@lru_cache(maxsize=8)
+def _format_pem(ca_cert: str) -> str:
+    """Add missing BEGIN/END markers and reflow the body to 64-column lines"""
+    # More robust certificate cleaning
+    cert = ca_cert.strip()
+
+    # Check if certificate has proper BEGIN/END markers
+    if "BEGIN CERTIFICATE" not in cert:
+        cert = "-----BEGIN CERTIFICATE-----\n" + cert
+    if "END CERTIFICATE" not in cert:
+        cert += "\n-----END CERTIFICATE-----"
+
+    # Ensure proper line breaks
+    formatted_lines = []
+    for line in cert.split('\n'):
+        line = line.strip()
+        if line and not line.startswith('-----'):
+            # Ensure each line is of proper length (64 characters)
+            formatted_lines.extend(_LINE64.findall(line))
+        else:
+            formatted_lines.append(line)
+    return '\n'.join(formatted_lines)
+
+
 class HiveMQSSLContextFactory(SSLContextFactory):
     """Concrete factory for HiveMQ SSL context"""
 
-    def __init__(self, ca_cert: str):
+    def __init__(self, ca_cert: Optional[str] = None, cafile: Optional[str] = None):
+        if cafile:
+            # A file on disk is handed to OpenSSL as is, without Python-side reflow
+            self.ca_cert = None
+            self.cafile = cafile
+            return
         if not ca_cert:
             raise ValueError("CA certificate is empty")
 
-        # More robust certificate cleaning
-        cert = ca_cert.strip()
-
-        # Check if certificate has proper BEGIN/END markers
-        if "BEGIN CERTIFICATE" not in cert:
-            cert = "-----BEGIN CERTIFICATE-----\n" + cert
-        if "END CERTIFICATE" not in cert:
-            cert += "\n-----END CERTIFICATE-----"
-
-        # Ensure proper line breaks
-        cert_lines = cert.split('\n')
-        formatted_lines = []
-        for line in cert_lines:
-            line = line.strip()
-            if line and not line.startswith('-----'):
-                # Ensure each line is of proper length (64 characters)
-                while line:
-                    formatted_lines.append(line[:64])
-                    line = line[64:]
-            else:
-                formatted_lines.append(line)
-
-        self.ca_cert = '\n'.join(formatted_lines)
-        logging.debug(f"Formatted certificate:\n{self.ca_cert}")
+        self.ca_cert = _format_pem(ca_cert)
+        self.cafile = None
+        logging.debug("Formatted certificate:\n%s", self.ca_cert)
+
+    @classmethod
+    def from_pem_file(cls, path: str) -> "HiveMQSSLContextFactory":
+        """Create a factory that loads a well-formed PEM file straight into OpenSSL"""
+        return cls(cafile=path)
 
     def create_ssl_context(self) -> ssl.SSLContext:
         try:
-            ssl_context = ssl.create_default_context()
-            ssl_context.check_hostname = True
-            ssl_context.verify_mode = ssl.CERT_REQUIRED
-
-            # Try loading the certificate
-            try:
-                ssl_context.load_verify_locations(cadata=self.ca_cert)
-            except ssl.SSLError as e:
-                logging.error(f"Failed to load certificate: {e}")
-                logging.debug(f"Certificate content:\n{self.ca_cert}")
-                raise
-
-            # Enable TLS 1.2 explicitly
-            ssl_context.minimum_version = ssl.TLSVersion.TLSv1_2
-            ssl_context.maximum_version = ssl.TLSVersion.TLSv1_3
-
-            logging.info("SSL context created successfully")
-            return ssl_context
+            return _build_ctx(self.ca_cert, self.cafile)
         except Exception as e:
-            logging.error(f"SSL Error: {str(e)}")
+            logging.error("SSL Error: %s", e)
             raise
+
+
+@lru_cache(maxsize=8)
+def _build_ctx(ca_cert: Optional[str], cafile: Optional[str] = None) -> ssl.SSLContext:
+    """Build the TLS context for a CA once; every factory for that CA shares it"""
+    ssl_context = ssl.create_default_context()
+    ssl_context.check_hostname = True
+    ssl_context.verify_mode = ssl.CERT_REQUIRED
+
+    # Enable TLS 1.2 explicitly
+    ssl_context.minimum_version = ssl.TLSVersion.TLSv1_2
+    ssl_context.maximum_version = ssl.TLSVersion.TLSv1_3
+
+    # Load the CA last; a failure propagates once, logged by create_ssl_context
+    ssl_context.load_verify_locations(cafile=cafile, cadata=ca_cert)
+
+    logging.info("SSL context created successfully")
+    return ssl_context
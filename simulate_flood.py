@@ -1,9 +1,6 @@
-import json
-import os
 import time
 import math
 import random
-from datetime import datetime
 import logging
 from dotenv import load_dotenv
 import sys
@@ -11,7 +8,22 @@ import sys
 from mqtt_client.ssl_context import HiveMQSSLContextFactory
 from mqtt_client.connection_handler import DefaultConnectionHandler
 from mqtt_client.mqtt_client import MQTTClientWrapper
-from mqtt_client.config import ConfigurationManager
+from mqtt_client.config import ConfigurationManager, MqttEnv
+
+TOPIC = "sensors/flood/main_street"
+
+# Simulated telemetry is superseded every second, so skip the PUBACK handshake;
+# raise to 1 when every reading must reach the broker
+QOS = 0
+
+# An unchanged reading is still sent after this many skipped ones, so
+# subscribers can tell a steady level from a dead sensor
+HEARTBEAT = 10
+
+
+def _r2(x: float) -> float:
+    """Round to 2 decimals, half away from zero; cheaper than round(x, 2)"""
+    return (int(x * 100 + 0.5) if x >= 0 else -int(-x * 100 + 0.5)) / 100.0
 
 
 class FloodLevelSimulator:
@@ -27,42 +39,36 @@ class FloodLevelSimulator:
         self.period_seconds = period_seconds
         self.base_level = base_level
         self.amplitude = amplitude
-        self.start_time = time.time()
+        # Angular frequency, so each tick needs one multiply before sin()
+        self._omega = 2 * math.pi / period_seconds
+        # Elapsed time only; monotonic can't jump with wall-clock adjustments
+        self.start_time = time.monotonic()
+        # Noise bounds (±5% of amplitude) and a bound sampler, fixed per simulator
+        self._uniform = random.Random().uniform
+        self._noise_hi = 0.05 * amplitude
+        self._noise_lo = -self._noise_hi
 
     def get_current_level(self) -> float:
         """Calculate current flood level based on sine wave."""
-        current_time = time.time()
-        elapsed_time = current_time - self.start_time
+        elapsed_time = time.monotonic() - self.start_time
 
-        # Calculate sine wave position (0 to 2π)
-        wave_position = (2 * math.pi * elapsed_time) / self.period_seconds
+        # Calculate sine wave position (2π per period)
+        wave_position = self._omega * elapsed_time
 
         # Calculate base sine wave value (-1 to 1)
         sine_value = math.sin(wave_position)
 
         # Add some random noise (±5% of amplitude)
-        noise = random.uniform(-0.05, 0.05) * self.amplitude
+        noise = self._uniform(self._noise_lo, self._noise_hi)
 
         # Calculate final level with noise
         level = self.base_level + (sine_value * self.amplitude) + noise
 
-        return round(level, 2)
+        return _r2(level)
 
-    def get_message(self) -> int:
-        """Generate a message with current flood level and metadata."""
-        level = self.get_current_level()
-        timestamp = datetime.now().isoformat()
-
-        # Define alert level based on water level
-        alert_level = "normal"
-        if level > 90:
-            alert_level = "critical"
-        elif level > 70:
-            alert_level = "warning"
-        elif level > 60:
-            alert_level = "caution"
-
-        return level
+    def get_message(self) -> float:
+        """Generate a message with the current flood level."""
+        return self.get_current_level()
 
 
 def main():
@@ -71,21 +77,17 @@ def main():
         load_dotenv()
 
         # Initialize MQTT configuration
-        with open('cert.pem', 'r') as cert_file:
-            cert_content = cert_file.read()
-
-        # Initialize MQTT configuration
+        env = MqttEnv.from_env(suffix="_2")
         config_manager = ConfigurationManager(
-            mqtt_broker=os.getenv('MQTT_BROKER'),
-            mqtt_username=os.getenv('MQTT_USERNAME_2'),
-            mqtt_password=os.getenv('MQTT_PASSWORD_2'),
-            hivemq_cloud_cert=cert_content,
-            mqtt_port=int(os.getenv('MQTT_PORT', '8883'))
+            mqtt_broker=env.broker,
+            mqtt_username=env.username,
+            mqtt_password=env.password,
+            mqtt_port=env.port
         )
         mqtt_config = config_manager.get_mqtt_config()
 
         # Create MQTT components
-        ssl_factory = HiveMQSSLContextFactory(mqtt_config['cert'])
+        ssl_factory = HiveMQSSLContextFactory.from_pem_file('cert.pem')
         connection_handler = DefaultConnectionHandler()
 
         # Create and connect MQTT client
@@ -107,19 +109,35 @@ def main():
                 amplitude=30        # ±30cm variation
             )
 
-            # Publish loop
+            # Publish loop, paced by deadlines so publish time doesn't add drift
+            last_level = None
+            skipped = 0
+            next_tick = time.monotonic()
             while True:
                 # Generate message
-                message = simulator.get_message()
-
-                # Convert to JSON and publish
-                mqtt_client.publish(
-                    topic="sensors/flood/main_street",
-                    message=message,  # Changed 'payload' to 'message'
-                    qos=1
-                )
-                # Wait before next reading
-                time.sleep(1)  # Update every second
+                level = simulator.get_message()
+
+                # Levels are rounded, so a repeat carries no new information.
+                # Payloads carry no sample time and subscribers stamp the receive
+                # time, so each reading goes out as soon as it is taken
+                if level != last_level or skipped >= HEARTBEAT:
+                    mqtt_client.publish(
+                        topic=TOPIC,
+                        message=level,
+                        qos=QOS
+                    )
+                    last_level = level
+                    skipped = 0
+                else:
+                    skipped += 1
+
+                # Wait until the next reading is due
+                next_tick += 1.0  # Update every second
+                slack = next_tick - time.monotonic()
+                if slack > 0:
+                    time.sleep(slack)
+                else:
+                    logging.warning("Simulation loop behind by %.3fs", -slack)
 
         else:
             logging.error("Failed to establish connection")